@@ -0,0 +1,26 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Handlers spend nearly all their time waiting on LiveJournal and Firestore,
+# so we serve them from gevent workers (see app.yaml), which monkey-patch the
+# standard library themselves before loading the app.
+
+
+def post_worker_init(worker):
+    # grpc must be told about gevent after the worker has patched, but before
+    # any channel exists. post_fork runs before the patch; this runs after it,
+    # and the Firestore and Tasks clients aren't built until a request needs
+    # them.
+    import grpc.experimental.gevent
+    grpc.experimental.gevent.init_gevent()
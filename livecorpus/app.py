@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request
 import re
+import typing
 from urllib import parse as urlparse
 import traceback
 
@@ -21,6 +23,15 @@ from . import fetch, parse, quirks, store, task_queue
 
 app = Flask(__name__)
 
+_ENTRY_PATH_RE = re.compile(r'\/(\d+)\.html')
+_THREAD_QS_RE = re.compile(r'(?:^|&)thread=([^&]+)')
+_PAGE_QS_RE = re.compile(r'(?:^|&)page=[^&]')
+# Thread pages each handler fetches at once, on top of its own entry page.
+# Cloud Tasks' queue rate limits don't see these, so together with
+# max_concurrent_requests (app.yaml) this bounds the load we put on
+# LiveJournal.
+MAX_INLINE_THREAD_FETCHES = 2
+
 try:
     import os
     # if os.environ.get('NODE_ENV') == 'production':
@@ -50,7 +61,7 @@ def hello():
 @app.route('/scrape_entry_list', methods=['POST'])
 def scrape_entry_list():
     url = request.get_data(as_text=True)
-    raw_entry_list = fetch.fetch_text(url)
+    raw_entry_list = fetch.fetch_bytes(url)
     parsed_entry_list = parse.parse_entry_list(raw_entry_list)
     task_queue.enqueue_entries(parsed_entry_list.entry_links)
     if parsed_entry_list.prev_link:
@@ -65,29 +76,26 @@ def scrape_entry():
     url = request.get_data(as_text=True)
     parsed_url = urlparse.urlparse(url)
     community = parsed_url.netloc
-    qs = urlparse.parse_qs(parsed_url.query)
-    if 'thread' in qs:
-        reparse_root = qs['thread'][0]
-    else:
-        reparse_root = None
-    store_comments_only = 'thread' in qs or 'page' in qs
-    id = re.fullmatch(r'\/(\d+)\.html', parsed_url.path).group(1)
-    raw_entry = fetch.fetch_text(url)
+    thread = _THREAD_QS_RE.search(parsed_url.query)
+    reparse_root = urlparse.unquote(thread.group(1)) if thread else None
+    store_comments_only = bool(thread) or bool(
+        _PAGE_QS_RE.search(parsed_url.query))
+    id = _ENTRY_PATH_RE.fullmatch(parsed_url.path).group(1)
+    raw_entry = fetch.fetch_bytes(url)
     try:
         parsed_entry = parse.parse_entry(raw_entry, reparse_root)
-        if 'thread' in qs and qs['thread'][0] in parsed_entry.threads:
+        if reparse_root and reparse_root in parsed_entry.threads:
             # TODO: descend from top until (expand)?
             raise quirks.SnowflakeError('zipped again!')
         store.store_entry(community, id, parsed_entry.entry,
                           store_comments_only)
-        thread_urls = [
-            urlparse.urljoin(url, '?thread=%s' % thread)
-            for thread in parsed_entry.threads
-        ]
-        task_queue.enqueue_entries(thread_urls)
+        # One batch, so the leftover threads and the next page are enqueued
+        # concurrently rather than in two rounds of RPCs.
+        links = _scrape_threads(community, id, url, parsed_entry.threads)
         next_page = parsed_entry.next_page
         if next_page:
-            task_queue.enqueue_entries([next_page])
+            links.append(next_page)
+        task_queue.enqueue_entries(links)
     except Exception as e:
         # TODO punt to dead letter queue, include counter for retries for transient issues
         print("Scrape failed: community %s, entry %s\nURL %s" %
@@ -98,6 +106,43 @@ def scrape_entry():
         return "OK"
 
 
+def _thread_urls(url: str, threads: typing.Iterable[str]) -> typing.List[str]:
+    return [urlparse.urljoin(url, '?thread=%s' % thread) for thread in threads]
+
+
+# Thread pages live on the same host as their entry, so rather than paying a
+# Cloud Tasks round trip apiece we scrape them here, overlapping the fetches on
+# the shared session. Returns the urls still left for Cloud Tasks: any thread
+# that failed, plus whatever those pages zipped or paged on to in turn.
+def _scrape_threads(community: str, id: str, url: str,
+                    threads: typing.Iterable[str]) -> typing.List[str]:
+    threads = list(threads)
+    if not threads:
+        return []
+
+    def scrape_thread(thread: str, thread_url: str) -> typing.List[str]:
+        try:
+            parsed_entry = parse.parse_entry(fetch.fetch_bytes(thread_url),
+                                             thread)
+            if thread in parsed_entry.threads:
+                raise quirks.SnowflakeError('zipped again!')
+            store.store_entry(community, id, parsed_entry.entry, True)
+        except Exception as e:
+            print("Inline thread scrape failed, deferring to Tasks: %s" %
+                  thread_url)
+            print(e)
+            return [thread_url]
+        links = _thread_urls(url, parsed_entry.threads)
+        if parsed_entry.next_page:
+            links.append(parsed_entry.next_page)
+        return links
+
+    with ThreadPoolExecutor(max_workers=MAX_INLINE_THREAD_FETCHES) as executor:
+        results = executor.map(scrape_thread, threads,
+                               _thread_urls(url, threads))
+        return [deferred for urls in results for deferred in urls]
+
+
 def _handle_missing_prev_link(url: str) -> None:
     parsed_url = urlparse.urlparse(url)
     qs = urlparse.parse_qs(parsed_url.query)
@@ -14,6 +14,7 @@
 
 from requests import Session
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 headers = {
     # FIXME: insert your user agent here
@@ -21,13 +22,32 @@ headers = {
     'Accept-Encoding': 'deflate, gzip;q=1.0, *;q=0.5'
 }
 
+# Each Tasks worker may be fetching concurrently, so size the per-host pool
+# well past requests' default of 10 to keep connections alive and reused.
+POOL_SIZE = 32
+# (connect, read) seconds per attempt. Without one, a stalled page holds the
+# handler until App Engine kills the request.
+TIMEOUT = (5, 30)
+_COOKIES = {'adult_explicit': '1'}
+
 session = Session()
-session.mount('https://ftm.livejournal.com', HTTPAdapter(max_retries=5))
-session.mount('https://mtf.livejournal.com', HTTPAdapter(max_retries=5))
-session.mount('https://genderqueer.livejournal.com', HTTPAdapter(max_retries=5))
-session.mount('https://transgender.livejournal.com', HTTPAdapter(max_retries=5))
+for netloc in ['ftm', 'mtf', 'genderqueer', 'transgender']:
+    session.mount(
+        f'https://{netloc}.livejournal.com',
+        HTTPAdapter(
+            pool_connections=POOL_SIZE,
+            pool_maxsize=POOL_SIZE,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                # Once retries run out, hand back the last response
+                # rather than raising, as a plain get would.
+                raise_on_status=False)))
 session.headers.update(headers)
 
 
-def fetch_text(url: str) -> str:
-    return session.get(url, cookies={'adult_explicit': '1'}).text
+# We return the raw body rather than decoding it to text: lxml reads the
+# charset from the page itself, and this skips a decode/re-encode round trip.
+def fetch_bytes(url: str) -> bytes:
+    return session.get(url, cookies=_COOKIES, timeout=TIMEOUT).content
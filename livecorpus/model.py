@@ -12,14 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 import datetime
-from functools import reduce
 from typing import List, Optional
 
 
 @dataclass
 class LiveJournalEntry:
+    __slots__ = ('published', 'author', 'subject', 'content', 'comments',
+                 'tags')
+
     published: datetime.datetime
     author: str
     subject: str
@@ -30,7 +32,7 @@ class LiveJournalEntry:
     def __repr__(self) -> str:
         rep = "Entry: '%s' by %s, published %s\n" % (self.subject, self.author,
                                                      self.published)
-        comments = reduce(lambda x, y: x + str(y), self.comments, "")
+        comments = "".join(str(c) for c in self.comments)
         # This is hacky, but it obviates a second traversal.
         num_comments = comments.count("\n")
         rep += "%s comments total" % num_comments
@@ -41,18 +43,25 @@ class LiveJournalEntry:
 
 @dataclass
 class LiveJournalComment:
+    # We build lots of these per page, so skip the per-instance __dict__.
+    # dataclass(slots=True) needs 3.10, and hand-written slots can't coexist
+    # with field defaults, so use the constructors below.
+    __slots__ = ('id', 'deleted', 'published', 'author', 'content', 'children',
+                 'parent')
+
     id: str
     deleted: bool
-    published: Optional[datetime.datetime] = None
-    author: Optional[str] = None
-    content: Optional[str] = None
-    # TODO: subject: Optional[str] = None
+    published: Optional[datetime.datetime]
+    author: Optional[str]
+    content: Optional[str]
+    # TODO: subject: Optional[str]
 
-    children: List['LiveJournalComment'] = field(default_factory=list)
-    parent: Optional['LiveJournalComment'] = None
+    children: List['LiveJournalComment']
+    parent: Optional['LiveJournalComment']
 
     def __repr__(self) -> str:
-        return reduce(lambda x, y: "%s\n%s" % (x, y), self._repr_helper(1), "")
+        # Each line, including the first, starts with a newline.
+        return "".join("\n%s" % line for line in self._repr_helper(1))
 
     def _repr_helper(self, indent: int) -> List[str]:
         rep = '* ' * indent
@@ -68,15 +77,15 @@ class LiveJournalComment:
     @classmethod
     def live(cls, id: str, published: datetime.datetime, author: str,
              content: str) -> 'LiveJournalComment':
-        return cls(id, False, published, author, content)
+        return cls(id, False, published, author, content, [], None)
 
     @classmethod
     def dead(cls, id: str) -> 'LiveJournalComment':
-        return cls(id, True)
+        return cls(id, True, None, None, None, [], None)
 
     @classmethod
     def zipped(cls, id: str) -> 'LiveJournalComment':
-        return cls(id, False)
+        return cls(id, False, None, None, None, [], None)
 
     def add_child(self, child: 'LiveJournalComment') -> None:
         # Either of these indicates a bug in the parser.
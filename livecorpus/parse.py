@@ -12,19 +12,40 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from bs4 import BeautifulSoup, element
 from dataclasses import dataclass
 from datetime import datetime
 from dateutil import parser as dtparse
+from functools import lru_cache
+from lxml import etree
+import lxml.html
+from lxml.html import HtmlElement
 import re
-import tinycss2
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Pattern, Set, Tuple
 from urllib import parse as urlparse
 
 from . import quirks
 from .model import LiveJournalComment, LiveJournalEntry
 from .quirks import SnowflakeError
 
+_MARGIN_RE = re.compile(r'margin-left\s*:\s*(-?\d+)')
+# Replies sit one indent level (25px or 30px, by template) past their parent.
+_INDENT_STEPS = (25, 30)
+_HREFS_WITH_PREFIX = etree.XPath('//a[starts-with(@href, $prefix)]/@href',
+                                 smart_strings=False)
+# Older templates give comments ljcmt... IDs; newer ones nest .b-tree-twig
+# divs in the article. Either way, one pass returns them in document order.
+_COMMENT_WRAPS = etree.XPath(
+    '//*[starts-with(@id, "ljcmt") or (ancestor::article and '
+    'contains(concat(" ", normalize-space(@class), " "), " b-tree-twig "))]')
+_SEEMORE_WITH_PARENT = etree.XPath(
+    './/*[contains(@class, "b-leaf-seemore")][@data-parent]')
+
+# (indent, id) of a comment on the page.
+Indented = Tuple[int, str]
+# A comment's own indent, if it has one, and the closest preceding comment
+# indented less.
+IndentParent = Tuple[Optional[int], Optional[Indented]]
+
 
 @dataclass
 class EntryListParseResult:
@@ -39,32 +60,35 @@ class EntryParseResult:
     next_page: Optional[str]
 
 
-def parse_entry_list(raw_entry_list: str) -> EntryListParseResult:
-    tree = BeautifulSoup(raw_entry_list, 'lxml')
+def parse_entry_list(raw_entry_list: bytes) -> EntryListParseResult:
+    tree = lxml.html.fromstring(raw_entry_list)
     community = quirks.find_community(tree)
-    entry_link_pattern = re.compile(
-        rf'^https\://{community.netloc}.livejournal.com/(\d+).html')
-    links = set(
-        community.to_entry_url(
-            re.match(entry_link_pattern, a['href']).group(1))
-        for a in tree.find_all('a', href=entry_link_pattern))
+    entry_link_pattern = _entry_link_pattern(community.netloc)
+    hrefs = _HREFS_WITH_PREFIX(
+        tree, prefix=f'https://{community.netloc}.livejournal.com/')
+    matches = (entry_link_pattern.match(href) for href in hrefs)
+    links = set(community.to_entry_url(m.group(1)) for m in matches if m)
     maybe_prev_link = community.entry_list_prev_link(tree)
     return EntryListParseResult(links, maybe_prev_link)
 
 
-def parse_entry(raw_entry_text: str,
+def parse_entry(raw_entry: bytes,
                 reparse_root: Optional[str]) -> EntryParseResult:
-    tree = BeautifulSoup(raw_entry_text, 'lxml')
+    tree = lxml.html.fromstring(raw_entry)
     community = quirks.find_community(tree)
 
-    subject = tree.select_one('meta[property="og:title"]')['content']
+    subject = quirks.select_one(tree,
+                                'meta[property="og:title"]').get('content')
 
     published = community.entry_published(tree)
     # TODO: perhaps edited when available?
 
     username = community.entry_username(tree)
     content = community.entry_content(tree)
-    tags = [t['content'] for t in tree.select('meta[property="article:tag"]')]
+    tags = [
+        t.get('content')
+        for t in quirks.select(tree, 'meta[property="article:tag"]')
+    ]
 
     root_comments, threads = _parse_entry_comments(tree, community,
                                                    reparse_root)
@@ -77,22 +101,20 @@ def parse_entry(raw_entry_text: str,
     return EntryParseResult(ent, threads, next_page)
 
 
-def _search_next_comment_page(entry_tree: element.Tag) -> Optional[str]:
-    next_page = entry_tree.select_one('.comments-pages-next a')
-    if next_page:
-        return next_page['href']
+def _search_next_comment_page(entry_tree: HtmlElement) -> Optional[str]:
+    next_page = quirks.select_one(entry_tree, '.comments-pages-next a')
+    if next_page is not None:
+        return next_page.get('href')
     else:
         return None
 
 
 def _parse_entry_comments(
-    entry_tree: element.Tag, community: quirks.Community,
-    reparse_root: Optional[str]
+        entry_tree: HtmlElement, community: quirks.Community,
+        reparse_root: Optional[str]
 ) -> Tuple[List[LiveJournalComment], Set[str]]:
 
-    comment_wraps = entry_tree.find_all(id=re.compile('ljcmt*'))
-    if not comment_wraps:
-        comment_wraps = entry_tree.select('article .b-tree-twig')
+    comment_wraps = _COMMENT_WRAPS(entry_tree)
     if not comment_wraps:
         # No comments, at least that we know of.
         return [], set()
@@ -101,42 +123,51 @@ def _parse_entry_comments(
     # TODO: handle too many (paging?)
     parsed: Dict[str, LiveJournalComment] = dict()
     roots: List[LiveJournalComment] = list()
+    # The IDs in roots, for quick membership checks.
+    root_ids: Set[str] = set()
     threads: Set[str] = set()
+    # Each comment enclosing the current one, innermost last.
+    enclosing: List[Indented] = list()
     for comment in comment_wraps:
-        if comment.has_attr('data-tid'):
-            id = comment['data-tid'][1:]  # t...
+        if 'data-tid' in comment.attrib:
+            id = comment.get('data-tid')[1:]  # t...
             if not id:
                 # surprising hidden stuff
-                foo = comment.find_all(class_=re.compile('b-leaf-seemore'),
-                                       attrs={'data-parent': True})
+                foo = _SEEMORE_WITH_PARENT(comment)
                 if not foo:
                     raise SnowflakeError('fart')
-                threads.add(foo[0]['data-parent'])
+                threads.add(foo[0].get('data-parent'))
                 continue
-        elif comment.has_attr('id'):
-            id = comment['id'][5:]  # ljcmt...
+        elif 'id' in comment.attrib:
+            id = comment.get('id')[5:]  # ljcmt...
         else:
             raise SnowflakeError('poop')
 
-        if community.is_comment_deleted(comment):
+        indent_parent = _indent_parent(comment, id, enclosing)
+        kind = community.classify_comment(comment)
+        if kind is quirks.CommentKind.DEAD:
             # TODO: No reparse root: are we missing threads whose original post has been deleted?
-            _parse_deleted_comment(id, community, comment, roots, parsed)
+            _parse_deleted_comment(id, community, comment, roots, root_ids,
+                                   parsed, indent_parent)
         else:
-            _parse_live_comment(id, community, comment, roots, parsed, threads,
-                                reparse_root)
+            _parse_live_comment(id, community, comment, roots, root_ids, parsed,
+                                threads, reparse_root, indent_parent, kind
+                                is quirks.CommentKind.ZIPPED)
     return roots, threads
 
 
 def _parse_live_comment(id: str, community: quirks.Community,
-                        comment: element.Tag, roots: List[LiveJournalComment],
-                        parsed: Dict[str, LiveJournalComment],
-                        threads: Set[str], reparse_root: Optional[str]) -> None:
-    if community.is_comment_zipped(comment):
+                        comment: HtmlElement, roots: List[LiveJournalComment],
+                        root_ids: Set[str], parsed: Dict[str,
+                                                         LiveJournalComment],
+                        threads: Set[str], reparse_root: Optional[str],
+                        indent_parent: IndentParent, is_zipped: bool) -> None:
+    if is_zipped:
         # Happens when comments are hidden (i.e. deep nesting).
         zipped = LiveJournalComment.zipped(id)
         thread_id = id
         parsed[id] = zipped
-        parent_id = _search_parent(community, comment)
+        parent_id = _search_parent(community, comment, indent_parent)
         if parent_id:  # If not present, this may be a root.
             parent = parsed[parent_id]
             zipped.set_parent(parent)
@@ -147,7 +178,6 @@ def _parse_live_comment(id: str, community: quirks.Community,
                     return
                 parent = parent.parent
             # thread_id should be a *root*.
-            root_ids = [r.id for r in roots]
             if thread_id not in root_ids:
                 raise SnowflakeError('thread_id was not root: %s' % thread_id)
             if reparse_root and reparse_root == thread_id:
@@ -158,9 +188,9 @@ def _parse_live_comment(id: str, community: quirks.Community,
         return
 
     published = community.comment_published(comment)
-    probable_author = comment.select_one('.i-ljuser-username b')
-    if probable_author:
-        author = probable_author.text
+    probable_author = quirks.select_one(comment, '.i-ljuser-username b')
+    if probable_author is not None:
+        author = probable_author.text_content()
     else:
         author = '(Anonymous)'
     content = community.comment_content(comment)
@@ -169,9 +199,10 @@ def _parse_live_comment(id: str, community: quirks.Community,
     if reparse_root and reparse_root == id:
         # if we try to look up the parent, we'll blow up
         roots.append(modeled)
+        root_ids.add(id)
         return
     # look for a parent if present
-    parent_id = _search_parent(community, comment)
+    parent_id = _search_parent(community, comment, indent_parent)
     if parent_id:
         if parent_id not in parsed:
             print(f'{id}, {parent_id}, {parsed}')
@@ -180,14 +211,15 @@ def _parse_live_comment(id: str, community: quirks.Community,
         modeled.set_parent(parent_model)
     else:
         roots.append(modeled)
+        root_ids.add(id)
 
 
 def _parse_deleted_comment(id: str, community: quirks.Community,
-                           comment: element.Tag, roots: list,
-                           parsed: dict) -> None:
+                           comment: HtmlElement, roots: list, root_ids: set,
+                           parsed: dict, indent_parent: IndentParent) -> None:
     modeled = LiveJournalComment.dead(id)
     parsed[id] = modeled
-    parent_id = _search_parent(community, comment)
+    parent_id = _search_parent(community, comment, indent_parent)
 
     if parent_id:
         parent = parsed[parent_id]
@@ -200,116 +232,85 @@ def _parse_deleted_comment(id: str, community: quirks.Community,
     else:
         # If we don't have a parent, this must be a root.
         roots.append(modeled)
+        root_ids.add(id)
 
 
-def _search_parent(community: quirks.Community,
-                   comment: element.Tag) -> Optional[str]:
+def _indent_parent(comment: HtmlElement, id: str,
+                   enclosing: List[Indented]) -> IndentParent:
+    # Comments are laid out flat in document order and nested only by indent,
+    # so the parent is the closest preceding comment that is indented less.
+    indent = _comment_indent_from_style(comment)
+    if indent is None:
+        # Without an indent we can't place this comment (or let it enclose
+        # anything); only its Parent link can.
+        return None, None
+    while enclosing and enclosing[-1][0] >= indent:
+        enclosing.pop()
+    parent = enclosing[-1] if enclosing else None
+    enclosing.append((indent, id))
+    return indent, parent
+
+
+def _search_parent(community: quirks.Community, comment: HtmlElement,
+                   indent_parent: IndentParent) -> Optional[str]:
     # This first method only works for "live" comments, and it should
     # *always* work for them. (Spoiler alert: it doesn't for genderqueer.)
     from_href = _parent_id_from_href(community, comment)
     if from_href:
         return from_href
 
-    indent = _comment_indent_from_style(comment)
+    # Deleted comments have no Parent link, so fall back to the indent.
+    indent, parent = indent_parent
+    if indent is None:
+        raise SnowflakeError('Could not find parent for %s' % comment)
 
     if indent == 0:
         # This is a root, so it has no parent.
         return None
 
-    def is_comment(tag: element.Tag) -> bool:
-        return tag.name == 'div' and (
-            (tag.has_attr('id') and bool(re.match('ljcmt*', tag['id']))) or
-            (tag.has_attr('class') and 'b-tree-twig' in tag['class']))
-
-    # try two divs before
-    # TODO: this varies by template
-    # previous = comment.previous_sibling
-
-    previous_siblings = [p for p in comment.previous_siblings if is_comment(p)]
-
-    # if previous and not is_comment(previous):
-    #     previous = previous.previous_sibling
-
-    if not previous_siblings:
+    if parent is None:
         raise SnowflakeError('no previous siblings found')
 
-    previous = previous_siblings.pop(0)
-
-    if not previous or not is_comment(previous):
-        # We found something, but it's not a comment.
-        # double-dead *should* already be handled
-        raise SnowflakeError('previous sibling was a non-comment: %s' %
-                             previous)
-
-    previous_indent = _comment_indent_from_style(previous)
-    while previous_indent > indent:
-        # The previous comment was a subcomment of another thread.
-        # TODO: varies by template
-        previous = previous_siblings.pop(0)
-
-        if not previous or not is_comment(previous):
-            previous = previous_siblings.pop(0)
-
-        if not previous:
-            raise SnowflakeError(
-                'ran out of retries looking for parent for %s' % comment)
-
-        if not is_comment(previous):
-            # We don't know what's going on.
-            raise SnowflakeError('previous sibling was a non-comment')
-
-        previous_indent = _comment_indent_from_style(previous)
-
-    if previous_indent == indent:
-        # This comment is at the same level as the one before it,
-        # so they presumably have the same parent.
-        previous_parent_id = _search_parent(community, previous)
-        if not previous_parent_id:
-            # We always expect the previous comment to have a parent,
-            # unless it's a root, in which case either:
-            # *this* is a parent, which should have been caught with
-            # the indent == 0 check above, *or* it's our parent (see
-            # logic below)
-            raise SnowflakeError('Expected a previous parent, none found')
-        return previous_parent_id
-    elif previous_indent == indent - 25 or previous_indent == indent - 30:
-        # the previous element *is* our parent
-        # the deleted comment is the first reply
-        # TODO: FIX THIS
-        if previous.has_attr('data-tid'):
-            tid = re.match(r't(\d+)', previous['data-tid'])
-            return tid.group(1)  # t...
-        else:
-            return previous['id'][5:]  # ljcmt...
-    else:
-        print(f'indent: {indent}, previous_indent: {previous_indent}')
+    parent_indent, parent_id = parent
+    if indent - parent_indent not in _INDENT_STEPS:
+        print(f'indent: {indent}, previous_indent: {parent_indent}')
         raise SnowflakeError('Could not find parent for %s' % comment)
+    return parent_id
 
 
 def _parent_id_from_href(community: quirks.Community,
-                         comment: element.Tag) -> Optional[str]:
+                         comment: HtmlElement) -> Optional[str]:
+    parent_href_pattern = _parent_href_pattern(community.netloc)
     parent = [
-        a for a in comment.select('a[href]') if a.text == 'Parent' and
-        re.match(f'http[s]*://{community.netloc}.livejournal.com', a['href'])
+        a for a in quirks.select(comment, 'a[href]')
+        if a.text_content() == 'Parent' and
+        parent_href_pattern.match(a.get('href'))
     ]
     if parent:
         if not len(parent) == 1:
             raise SnowflakeError('Multiple parents?!')
-        return _comment_id_from_url(parent[0]['href'])
+        return _comment_id_from_url(parent[0].get('href'))
     else:
         return None
 
 
+@lru_cache(maxsize=None)
+def _entry_link_pattern(netloc: str) -> Pattern[str]:
+    return re.compile(rf'^https\://{netloc}.livejournal.com/(\d+).html')
+
+
+@lru_cache(maxsize=None)
+def _parent_href_pattern(netloc: str) -> Pattern[str]:
+    return re.compile(f'http[s]*://{netloc}.livejournal.com')
+
+
 def _comment_id_from_url(url: str) -> str:
     parsed_url = urlparse.urlparse(url)
     return parsed_url.fragment[1:]  # t...
 
 
-def _comment_indent_from_style(comment: element.Tag) -> int:
-    for declaration in tinycss2.parse_declaration_list(comment['style']):
-        if declaration.name == 'margin-left':
-            for token in declaration.value:
-                if token.type == 'dimension':
-                    return token.int_value
-
-    raise SnowflakeError('Could not determine indent: %s' % comment)
+def _comment_indent_from_style(comment: HtmlElement) -> Optional[int]:
+    m = _MARGIN_RE.search(comment.get('style', ''))
+    if m:
+        return int(m.group(1))
+    return None
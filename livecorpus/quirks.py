@@ -13,13 +13,15 @@
 # limitations under the License.
 
 from abc import ABCMeta, abstractmethod
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 from collections import defaultdict
+from cssselect import HTMLTranslator
 from dataclasses import dataclass
 from datetime import datetime
 from dateutil import parser as dtparse
 from enum import Enum
+from functools import lru_cache
+from lxml import etree
+from lxml.html import HtmlElement
 import re
 import typing
 from urllib import parse as urlparse
@@ -29,58 +31,118 @@ class SnowflakeError(Exception):
     pass
 
 
+class CommentKind(Enum):
+    LIVE = 'live'
+    DEAD = 'dead'
+    ZIPPED = 'zipped'
+
+
+_css = HTMLTranslator()
+_ASCII_SPACES = ' \t\n\f\r'
+_INDEX_PUNCTUATION_RE = re.compile(r'\[|\|')
+_DESCENDANT_TEXT = etree.XPath('.//text()', smart_strings=False)
+_JOURNAL_TITLE = etree.XPath('.//*[contains(@title, "journal")]')
+_FTM_PREV_HREF = etree.XPath(
+    '(//ul[contains(@class, "page-nav")])[1]//a[. = "Next 10"]/@href',
+    smart_strings=False)
+# Compared in XPath so we never build the text of a (long) live comment.
+_IS_DELETED_PLACEHOLDER = etree.XPath('string(.) = "(Deleted comment)"')
+_MTF_PREV_HREF = etree.XPath('//a[@href][. = "earlier"]/@href',
+                             smart_strings=False)
+
+
+@lru_cache(maxsize=None)
+def _compile_selector(selector: str,
+                      index: typing.Optional[int] = None) -> etree.XPath:
+    # Like BeautifulSoup's select, only match descendants of el (cssselect
+    # defaults to descendant-or-self).
+    xpath = _css.css_to_xpath(selector, prefix='descendant::')
+    if index is not None:
+        # Let libxml2 stop at the match we want rather than collect them all.
+        xpath = '(%s)[%d]' % (xpath, index + 1)
+    return etree.XPath(xpath)
+
+
+def select(el: HtmlElement, selector: str) -> typing.List[HtmlElement]:
+    return _compile_selector(selector)(el)
+
+
+def select_one(el: HtmlElement,
+               selector: str,
+               index: int = 0) -> typing.Optional[HtmlElement]:
+    # index counts matches like select(el, selector)[index] would.
+    matches = _compile_selector(selector, index)(el)
+    return matches[0] if matches else None
+
+
+# LiveJournal's machine-readable dates are ISO 8601, which fromisoformat reads
+# far faster than dateutil's try-everything parser; anything else falls back.
+def _fast_parse_iso(s: str) -> datetime:
+    try:
+        return datetime.fromisoformat(s.replace('Z', '+00:00'))
+    except ValueError:
+        return dtparse.parse(s)
+
+
+def text(el: HtmlElement) -> str:
+    # BeautifulSoup collapsed whitespace-only strings to a single newline (or
+    # space), and stored content was scraped that way, so keep doing it.
+    return ''.join(s if s.strip(_ASCII_SPACES) else '\n' if '\n' in s else ' '
+                   for s in _DESCENDANT_TEXT(el))
+
+
 # ignore comment for mypy: https://github.com/python/mypy/issues/5374
 @dataclass  # type: ignore[misc]
 class Community(metaclass=ABCMeta):
     netloc: str
 
-    @classmethod
-    def __all_subclasses__(cls) -> typing.List['Community']:
-        # TODO make this real
-        return [FTM(), MTF(), Genderqueer(), Transgender()]
-
     @classmethod
     def from_netloc(cls, netloc: str) -> 'Community':
-        communities: typing.List[Community] = cls.__all_subclasses__()
-        result: typing.List[Community] = [
-            c for c in communities if c.netloc == netloc
-        ]
-        if not result:
+        try:
+            return _COMMUNITIES[netloc]
+        except KeyError:
             raise SnowflakeError('Unknown community')
-        return result[0]
 
     @abstractmethod
-    def comment_content(self, comment: Tag) -> str:
+    def comment_content(self, comment: HtmlElement) -> str:
         pass
 
     @abstractmethod
-    def comment_published(self, comment: Tag) -> datetime:
+    def comment_published(self, comment: HtmlElement) -> datetime:
         pass
 
     @abstractmethod
-    def entry_content(self, tree: BeautifulSoup) -> str:
+    def entry_content(self, tree: HtmlElement) -> str:
         pass
 
     @abstractmethod
-    def entry_list_prev_link(self, tree: BeautifulSoup) -> typing.Optional[str]:
+    def entry_list_prev_link(self, tree: HtmlElement) -> typing.Optional[str]:
         pass
 
     @abstractmethod
-    def entry_published(self, tree: BeautifulSoup) -> datetime:
+    def entry_published(self, tree: HtmlElement) -> datetime:
         pass
 
     @abstractmethod
-    def entry_username(self, tree: BeautifulSoup) -> str:
+    def entry_username(self, tree: HtmlElement) -> str:
         pass
 
     @abstractmethod
-    def is_comment_deleted(self, comment: Tag) -> bool:
+    def is_comment_deleted(self, comment: HtmlElement) -> bool:
         pass
 
     @abstractmethod
-    def is_comment_zipped(self, comment: Tag) -> bool:
+    def is_comment_zipped(self, comment: HtmlElement) -> bool:
         pass
 
+    def classify_comment(self, comment: HtmlElement) -> CommentKind:
+        # Only live comments are ever zipped, so skip that check for the dead.
+        if self.is_comment_deleted(comment):
+            return CommentKind.DEAD
+        if self.is_comment_zipped(comment):
+            return CommentKind.ZIPPED
+        return CommentKind.LIVE
+
     def to_entry_url(self, id: str) -> str:
         return f'https://{self.netloc}.livejournal.com/{id}.html'
 
@@ -89,88 +151,83 @@ class Community(metaclass=ABCMeta):
 class FTM(Community):
     netloc: str = 'ftm'
 
-    def comment_content(self, comment: Tag) -> str:
-        return comment.select_one('.comment-text').text
+    def comment_content(self, comment: HtmlElement) -> str:
+        return text(select_one(comment, '.comment-text'))
 
-    def comment_published(self, comment: Tag) -> datetime:
+    def comment_published(self, comment: HtmlElement) -> datetime:
         return datetime.strptime(
-            comment.select_one('.comment-permalink').text,
+            select_one(comment, '.comment-permalink').text_content(),
             '%Y-%m-%d %I:%M %p (UTC)')
 
-    def entry_content(self, tree: BeautifulSoup) -> str:
-        return tree.select_one('.entry-text .entry-content').text
+    def entry_content(self, tree: HtmlElement) -> str:
+        return text(select_one(tree, '.entry-text .entry-content'))
 
-    def entry_list_prev_link(self, tree: BeautifulSoup) -> typing.Optional[str]:
-        ul = tree.find('ul', class_=re.compile('page-nav'))
-        if not ul:
-            return None
-        link = ul.find('a', text='Next 10')
-        return link['href'] if link else None
+    def entry_list_prev_link(self, tree: HtmlElement) -> typing.Optional[str]:
+        hrefs = _FTM_PREV_HREF(tree)
+        return hrefs[0] if hrefs else None
 
-    def entry_published(self, tree: BeautifulSoup) -> datetime:
-        return dtparse.parse(
-            tree.select_one('.entry-text .entry-date abbr')['title'])
+    def entry_published(self, tree: HtmlElement) -> datetime:
+        return _fast_parse_iso(
+            select_one(tree, '.entry-text .entry-date abbr').get('title'))
 
     def entry_username(self, tree) -> str:
-        return tree.select_one('.entry-text .username b').text
+        return select_one(tree, '.entry-text .username b').text_content()
 
-    def is_comment_deleted(self, comment: Tag) -> bool:
-        return 'deleted' in comment['class']
+    def is_comment_deleted(self, comment: HtmlElement) -> bool:
+        return 'deleted' in comment.classes
 
-    def is_comment_zipped(self, comment: Tag) -> bool:
-        return not comment.select_one('.comment-permalink')
+    def is_comment_zipped(self, comment: HtmlElement) -> bool:
+        return select_one(comment, '.comment-permalink') is None
 
 
 @dataclass
 class MTF(Community):
     netloc: str = 'mtf'
 
-    def comment_content(self, comment: Tag) -> str:
-        return comment.select('div')[1].text
+    def comment_content(self, comment: HtmlElement) -> str:
+        return text(select_one(comment, 'div', 1))
 
-    def comment_published(self, comment: Tag) -> datetime:
+    def comment_published(self, comment: HtmlElement) -> datetime:
         return datetime.strptime(
-            comment.find(title=re.compile('journal')).text,
+            _JOURNAL_TITLE(comment)[0].text_content(),
             '%Y-%m-%d %I:%M %p (UTC)')
 
-    def entry_content(self, tree: BeautifulSoup) -> str:
-        st = tree.select('article.entry-content')
-        if st:
-            return st[0].text
+    def entry_content(self, tree: HtmlElement) -> str:
+        st = select_one(tree, 'article.entry-content')
+        if st is not None:
+            return text(st)
 
-        raw = tree.select_one('table.s2-entrytext tr:nth-child(2)').text
-        return re.sub(rf'{self.netloc}\[\S+\]', '', raw, count=1)
+        raw = text(select_one(tree, 'table.s2-entrytext tr:nth-child(2)'))
+        return _community_label_pattern(self.netloc).sub('', raw, count=1)
 
-    def entry_list_prev_link(self, tree: BeautifulSoup) -> typing.Optional[str]:
-        el = tree.find("a", href=True, text="earlier")
-        return el['href'] if el else None
+    def entry_list_prev_link(self, tree: HtmlElement) -> typing.Optional[str]:
+        hrefs = _MTF_PREV_HREF(tree)
+        return hrefs[0] if hrefs else None
 
-    def entry_published(self, tree: BeautifulSoup) -> datetime:
-        st = tree.select('article time')
-        if st:
-            return dtparse.parse(st[0].text)
+    def entry_published(self, tree: HtmlElement) -> datetime:
+        st = select_one(tree, 'article time')
+        if st is not None:
+            return _fast_parse_iso(st.text_content())
 
-        contents = tree.select_one('table.s2-entrytext td.index').contents
-        raw = "%s %s" % (contents[0], contents[1])
-        raw = re.sub(r'\<\/?b\>', '', raw)
-        return dtparse.parse(re.sub(r'\[|\|', '', raw))
+        # e.g. [Feb. 3rd, 2008|<b>08:53 pm</b>]
+        index = select_one(tree, 'table.s2-entrytext td.index')
+        raw = "%s %s" % (index.text, index[0].text_content())
+        return dtparse.parse(_INDEX_PUNCTUATION_RE.sub('', raw))
 
-    def entry_username(self, tree: BeautifulSoup) -> str:
-        st = tree.select('article dl.author dt')
-        if st:
-            return st[0]['lj:user']
+    def entry_username(self, tree: HtmlElement) -> str:
+        st = select_one(tree, 'article dl.author dt')
+        if st is not None:
+            return st.get('lj:user')
 
-        return tree.select('table.s2-entrytext td font')[1].text
+        return select_one(tree, 'table.s2-entrytext td font', 1).text_content()
 
-    def is_comment_deleted(self, comment: Tag) -> bool:
-        return ((not comment.has_attr('class') or
-                 'ljcmt_full' not in comment['class']) and
-                comment.text == '(Deleted comment)') or bool(
-                    comment.select('.b-leaf-deleted'))
+    def is_comment_deleted(self, comment: HtmlElement) -> bool:
+        return ('ljcmt_full' not in comment.classes and
+                _IS_DELETED_PLACEHOLDER(comment)) or select_one(
+                    comment, '.b-leaf-deleted') is not None
 
-    def is_comment_zipped(self, comment: Tag) -> bool:
-        return (not comment.has_attr('class') or
-                'ljcmt_full' not in comment['class'])
+    def is_comment_zipped(self, comment: HtmlElement) -> bool:
+        return 'ljcmt_full' not in comment.classes
 
 
 @dataclass
@@ -180,29 +237,43 @@ class Genderqueer(MTF):
     def to_entry_url(self, id: str) -> str:
         return f'https://{self.netloc}.livejournal.com/{id}.html?nojs=1'
 
-    def comment_content(self, comment: Tag) -> str:
-        return comment.select_one('.b-leaf-article').text
+    def comment_content(self, comment: HtmlElement) -> str:
+        return text(select_one(comment, '.b-leaf-article'))
 
-    def comment_published(self, comment: Tag) -> datetime:
-        ts = comment.select_one('div.comment[data-updated-ts]')
-        if ts:
-            return datetime.fromtimestamp(int(ts['data-updated-ts']))
+    def comment_published(self, comment: HtmlElement) -> datetime:
+        ts = select_one(comment, 'div.comment[data-updated-ts]')
+        if ts is not None:
+            return datetime.fromtimestamp(int(ts.get('data-updated-ts')))
         raise SnowflakeError(f'no timestamp: {comment}')
 
-    def is_comment_zipped(self, comment: Tag) -> bool:
-        return bool(comment.select('.b-leaf-collapsed'))
+    def is_comment_zipped(self, comment: HtmlElement) -> bool:
+        return select_one(comment, '.b-leaf-collapsed') is not None
 
 
 @dataclass
 class Transgender(Genderqueer):
     netloc: str = 'transgender'
 
-    def entry_list_prev_link(self, tree: BeautifulSoup) -> typing.Optional[str]:
-        el = tree.select_one('.j-page-nav-item-prev a[href]')
-        return el['href'] if el else None
+    def entry_list_prev_link(self, tree: HtmlElement) -> typing.Optional[str]:
+        el = select_one(tree, '.j-page-nav-item-prev a[href]')
+        return el.get('href') if el is not None else None
+
+
+# Communities are stateless, so share one instance of each.
+_COMMUNITIES: typing.Dict[str, Community] = {
+    'ftm': FTM(),
+    'mtf': MTF(),
+    'genderqueer': Genderqueer(),
+    'transgender': Transgender()
+}
+
+
+@lru_cache(maxsize=None)
+def _community_label_pattern(netloc: str) -> typing.Pattern[str]:
+    return re.compile(rf'{netloc}\[\S+\]')
 
 
-def find_community(html: Tag) -> Community:
-    self_url = html.select_one('meta[property="og:url"]')['content']
+def find_community(html: HtmlElement) -> Community:
+    self_url = select_one(html, 'meta[property="og:url"]').get('content')
     parsed = urlparse.urlparse(self_url)
     return Community.from_netloc(parsed.netloc.split(".")[0])
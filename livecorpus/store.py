@@ -12,17 +12,55 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from google.cloud import exceptions, firestore
-from typing import Optional
+from functools import lru_cache
+from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
+from typing import Dict, List, Optional, Tuple
 
 from .model import LiveJournalComment, LiveJournalEntry
 
-db = firestore.Client(project='trans-corpus')
+
+# Built on first use rather than at import, so instance startup (and handlers
+# that never touch Firestore) skip the credential lookup and channel setup.
+@lru_cache(maxsize=None)
+def _db() -> firestore.Client:
+    return firestore.Client(project='trans-corpus')
+
+
+class StoreError(Exception):
+    pass
+
+
+# A write that keeps failing is retried (with linear backoff) this many times.
+MAX_WRITE_RETRIES = 3
+
+ParentRef = Optional[firestore.DocumentReference]
+# Comment ID -> the parent it was stored with, if any.
+ExistingParents = Dict[str, ParentRef]
 
 
 def store_entry(community: str, id: str, entry: LiveJournalEntry,
                 comments_only: bool) -> None:
-    docref = db.collection(community).document(id)
+    docref = _db().collection(community).document(id)
+    # Queue every write and let the BulkWriter batch them, rather than paying
+    # a round trip per comment.
+    writer = _db().bulk_writer()
+    # BulkWriter swallows failures: by default it retries a failed write 15
+    # times and then drops it, and a commit RPC that raises dies inside its
+    # executor. Record the writes we give up on, and count what actually
+    # landed, so that the caller hears about either.
+    failures: List[BulkWriteFailure] = list()
+    written: List[firestore.DocumentReference] = list()
+
+    def on_write_error(failure: BulkWriteFailure, _: BulkWriter) -> bool:
+        if failure.attempts < MAX_WRITE_RETRIES:
+            return True
+        failures.append(failure)
+        return False
+
+    writer.on_write_error(on_write_error)
+    writer.on_write_result(lambda docref, result, _: written.append(docref))
+    queued = 0
 
     if not comments_only:
         doc = {
@@ -32,46 +70,67 @@ def store_entry(community: str, id: str, entry: LiveJournalEntry,
             'content': entry.content,
             'tags': entry.tags
         }
-        docref.set(doc)
+        writer.set(docref, doc)
+        queued += 1
 
     comments_collection = docref.collection('Comments')
-    for comment in entry.comments:
-        store_comment(comment, comments_collection, comments_only)
+    existing_parents: ExistingParents = dict()
+    if comments_only and entry.comments:
+        # Reparsed roots may already have a parent from an earlier page; fetch
+        # them all in one round trip.
+        snapshots = _db().get_all(
+            [comments_collection.document(c.id) for c in entry.comments],
+            field_paths=['parent'])
+        existing_parents = {
+            snapshot.id: snapshot.get('parent')
+            for snapshot in snapshots
+            if snapshot.exists
+        }
+    queued += store_comments(entry.comments, comments_collection,
+                             existing_parents, writer)
+    # Blocks until all queued writes have been committed or given up on.
+    writer.close()
+    if failures or len(written) < queued:
+        raise StoreError('%d of %d writes failed for %s/%s: %s' %
+                         (queued - len(written), queued, community, id,
+                          failures[0].message if failures else 'commit failed'))
 
 
-# store_comment takes comments_only for the zipped-zipped case, in which we
+# store_comments takes existing_parents for the zipped-zipped case, in which we
 # re-store the parent comment
 
 
-def store_comment(comment: LiveJournalComment,
-                  collection: firestore.CollectionReference,
-                  comments_only: bool,
-                  parent: Optional[firestore.DocumentReference] = None) -> None:
+def store_comments(roots: List[LiveJournalComment],
+                   collection: firestore.CollectionReference,
+                   existing_parents: ExistingParents,
+                   writer: BulkWriter) -> int:
     # The parent property is a little surprising. Its use is only
     # so that we can reconstruct the comment *tree* without having to
     # store the comments hierarchically (which would suck for threads
     # with lots of replies).
-    docref = collection.document(comment.id)
-    if comment.deleted:
-        doc = {'deleted': True}
-    else:
-        doc = {
-            'published': comment.published,
-            'author': comment.author,
-            'content': comment.content
-        }
-    if comments_only and not parent:
-        try:
-            snapshot = docref.get(['parent'])
-            if snapshot.exists:
-                # Don't overwrite a parent if we already have one.
-                doc['parent'] = snapshot.get('parent')
-            else:
-                doc['parent'] = parent
-        except exceptions.NotFound:
+    #
+    # Walk the tree with an explicit stack; deep threads would otherwise
+    # recurse once per reply. Returns how many writes were queued.
+    queued = 0
+    stack: List[Tuple[LiveJournalComment,
+                      ParentRef]] = [(root, None) for root in roots]
+    while stack:
+        comment, parent = stack.pop()
+        docref = collection.document(comment.id)
+        if comment.deleted:
+            doc = {'deleted': True}
+        else:
+            doc = {
+                'published': comment.published,
+                'author': comment.author,
+                'content': comment.content
+            }
+        if parent:
             doc['parent'] = parent
-    else:
-        doc['parent'] = parent
-    docref.set(doc)
-    for subcomment in comment.children:
-        store_comment(subcomment, collection, comments_only, docref)
+        else:
+            # Don't overwrite a parent if we already have one.
+            doc['parent'] = existing_parents.get(comment.id)
+        writer.set(docref, doc)
+        queued += 1
+        stack.extend((child, docref) for child in comment.children)
+    return queued
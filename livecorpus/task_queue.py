@@ -12,21 +12,55 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from google.cloud import firestore, tasks_v2
 
 import base64
 import google.api_core.exceptions
 import hashlib
-import requests
 import typing
 
-db = firestore.Client(project='trans-corpus')
-tq = tasks_v2.CloudTasksClient()
+
+# Clients are built on first use rather than at import, so instance startup
+# (and handlers that never enqueue) skip credential lookup and channel setup.
+@lru_cache(maxsize=None)
+def _db() -> firestore.Client:
+    return firestore.Client(project='trans-corpus')
+
+
+@lru_cache(maxsize=None)
+def _tq() -> tasks_v2.CloudTasksClient:
+    return tasks_v2.CloudTasksClient()
+
+
+MAX_PARALLEL_ENQUEUES = 16
+
+# Queue paths never change, so build them (and their task name prefixes) once
+# rather than on every enqueue.
+_QUEUE_PATHS = {
+    name:
+        tasks_v2.CloudTasksClient.queue_path('trans-corpus', 'us-central1',
+                                             name)
+    for name in ('livejournal-entries', 'livejournal-entry-lists')
+}
+_TASK_PREFIXES = {
+    name: '%s/tasks/' % path for name, path in _QUEUE_PATHS.items()
+}
 
 
 def enqueue_entries(links: typing.List[str]) -> None:
-    for entry in links:
-        _enqueue_app_engine('/scrape_entry', 'livejournal-entries', entry)
+    if not links:
+        return
+    # Each create_task is a blocking RPC, so overlap them rather than paying
+    # one round trip per link. The client is safe to share across threads.
+    with ThreadPoolExecutor(
+            max_workers=min(len(links), MAX_PARALLEL_ENQUEUES)) as executor:
+        # list() so an unexpected RPC error still reaches the caller.
+        list(
+            executor.map(
+                partial(_enqueue_app_engine, '/scrape_entry',
+                        'livejournal-entries'), links))
 
 
 def enqueue_entry_list(link: str) -> None:
@@ -34,18 +68,19 @@ def enqueue_entry_list(link: str) -> None:
 
 
 def _enqueue_app_engine(handler: str, queue_name: str, url: str) -> None:
-    queue_full_name = tq.queue_path("trans-corpus", "us-central1", queue_name)
-    task_name = '{}/tasks/{}'.format(queue_full_name, _generate_task_name(url))
+    queue_full_name = _QUEUE_PATHS[queue_name]
+    url_bytes = url.encode('utf-8')
+    task_name = _TASK_PREFIXES[queue_name] + _generate_task_name(url_bytes)
     task = {
         'name': task_name,  # Prevents duplication. see _generate_task_name
         'app_engine_http_request': {
             'relative_uri': handler,
-            'body': url.encode()
+            'body': url_bytes
         }
     }
 
     try:
-        tq.create_task(queue_full_name, task)
+        _tq().create_task(queue_full_name, task)
     except google.api_core.exceptions.Conflict as _:
         # failed because of dedupe, "intentional"
         print("queue: %s, url: %s failed for dedupe" % (queue_name, url))
@@ -54,21 +89,22 @@ def _enqueue_app_engine(handler: str, queue_name: str, url: str) -> None:
 
 def enqueue_entry_dead_letter(community: str, id: str, url: str) -> None:
     # TODO: easy deletes because docs should be docs not collections
-    db.collection("DeadLetter").document(community).collection(
+    _db().collection("DeadLetter").document(community).collection(
         id).document().set({
             'time': firestore.SERVER_TIMESTAMP,
             'url': url
         })
 
 
-def _generate_task_name(url: str) -> str:
-    # Use a hash to avoid hotspotting Tasks.
-    hash = hashlib.sha1()
-    # Cloud Tasks continues to reject tasks with the same names as existing ones
-    # for some time after the originals are deleted--so in order to rerun after an
-    # unrecoverable failure (e.g. a parser bug) within that period, we increment `epoch` below.
-    epoch = b'1'
-    hash.update(epoch)
-    hash.update(url.encode('utf-8'))
-    # Encode as hex to guarantee a legal task name.
-    return hash.hexdigest()
+# Cloud Tasks continues to reject tasks with the same names as existing ones
+# for some time after the originals are deleted--so in order to rerun after an
+# unrecoverable failure (e.g. a parser bug) within that period, we increment `_EPOCH`.
+_EPOCH = b'1'
+
+
+def _generate_task_name(url_bytes: bytes) -> str:
+    # Use a hash to avoid hotspotting Tasks. It only needs to be stable, not
+    # cryptographic, so use the cheaper blake2b. 80 bits is plenty to dedupe
+    # within a queue, and keeps every name we send short. Encode as hex to
+    # guarantee a legal task name.
+    return hashlib.blake2b(_EPOCH + url_bytes, digest_size=10).hexdigest()
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import lru_cache
 import io
 import os
 import sys
@@ -21,6 +22,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
 import livecorpus
 
 
-def slurp_test_data(id: str) -> str:
-    with io.open('tests/data/%s.html' % id) as f:
+# Several tests share pages; bytes are immutable, so one read per page is safe.
+@lru_cache(maxsize=None)
+def slurp_test_data(id: str) -> bytes:
+    with io.open('tests/data/%s.html' % id, 'rb') as f:
         return f.read()
@@ -13,10 +13,12 @@
 # limitations under the License.
 
 import pytest
+import threading
+import time
 from unittest import mock
 
 from .context import livecorpus, slurp_test_data
-from livecorpus.app import app
+from livecorpus.app import MAX_INLINE_THREAD_FETCHES, app
 
 
 @pytest.fixture
@@ -30,27 +32,27 @@ def test_hello(client):
     assert resp.get_data() == b'Hello from livecorpus!'
 
 
-fetch_text = mock.MagicMock(name='fetch_text')
+fetch_bytes = mock.MagicMock(name='fetch_bytes')
 enqueue_entries = mock.MagicMock(name='enqueue_entries')
 
 parse_entry_list = mock.MagicMock(name='parse_entry_list')
 enqueue_entry_list = mock.MagicMock(name='enqueue_entry_list')
 
 
-@mock.patch('livecorpus.fetch.fetch_text', fetch_text)
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
 @mock.patch('livecorpus.parse.parse_entry_list', parse_entry_list)
 @mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
 @mock.patch('livecorpus.task_queue.enqueue_entry_list', enqueue_entry_list)
 def test_scrape_entry_list(client):
-    fetch_text.return_value = 'fetched_text'
+    fetch_bytes.return_value = b'fetched_bytes'
     parse_entry_list.return_value.entry_links = ['http://entry.link']
     parse_entry_list.return_value.prev_link = 'http://prev.link'
 
     url = 'http://entry.list'
     client.post('/scrape_entry_list', data=url)
-    fetch_text.assert_called_once_with(url)
+    fetch_bytes.assert_called_once_with(url)
     # This is crappy, effectively testing mock wiring, but it's > 0.
-    parse_entry_list.assert_called_once_with('fetched_text')
+    parse_entry_list.assert_called_once_with(b'fetched_bytes')
     enqueue_entries.assert_called_once_with(['http://entry.link'])
     enqueue_entry_list.assert_called_once_with('http://prev.link')
 
@@ -58,15 +60,25 @@ def test_scrape_entry_list(client):
 store_entry = mock.MagicMock(name='store_entry')
 
 
-@mock.patch('livecorpus.fetch.fetch_text', fetch_text)
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
 @mock.patch('livecorpus.store.store_entry', store_entry)
 @mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
 def test_scrape_entry(client):
     enqueue_entries.reset_mock()
-    fetch_text.return_value = slurp_test_data(7232256)
+    store_entry.reset_mock()
+    entry = slurp_test_data(7232256)
+
+    def fetch_entry_only(url):
+        if 'thread=' in url:
+            raise IOError('thread fetch failed')
+        return entry
+
+    fetch_bytes.side_effect = fetch_entry_only
 
     client.post('/scrape_entry',
                 data='https://ftm.livejournal.com/7232256.html')
+    fetch_bytes.side_effect = None
+    store_entry.assert_called_once()
     args, _ = store_entry.call_args
     assert args[0] == 'ftm.livejournal.com'
     assert args[1] == '7232256'
@@ -81,20 +93,127 @@ def test_scrape_entry(client):
         'https://ftm.livejournal.com/7232256.html?thread=%s' % thread
         for thread in expected_threads
     ]
-    calls = enqueue_entries.call_args_list
-    assert calls[0][0][0] == thread_urls
-    assert calls[1][0][0] == [
-        'https://ftm.livejournal.com/7232256.html?page=2#comments'
-    ]
+    # Every inline thread scrape failed, so each falls back to Cloud Tasks,
+    # batched with the next page.
+    enqueue_entries.assert_called_once()
+    links = enqueue_entries.call_args[0][0]
+    assert sorted(links[:-1]) == sorted(thread_urls)
+    next_page = 'https://ftm.livejournal.com/7232256.html?page=2#comments'
+    assert links[-1] == next_page
+
+
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
+@mock.patch('livecorpus.store.store_entry', store_entry)
+@mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
+def test_scrape_entry_threads_inline(client):
+    enqueue_entries.reset_mock()
+    store_entry.reset_mock()
+    entry = slurp_test_data(7232256)
+    thread = slurp_test_data('7232256-88040960')
+
+    def fetch_one_thread(url):
+        if url.endswith('?thread=88040960'):
+            return thread
+        if 'thread=' in url:
+            raise IOError('thread fetch failed')
+        return entry
+
+    fetch_bytes.side_effect = fetch_one_thread
+
+    client.post('/scrape_entry',
+                data='https://ftm.livejournal.com/7232256.html')
+    fetch_bytes.side_effect = None
+    assert store_entry.call_count == 2
+    # Only the thread page is stored comments_only.
+    thread_args = [args for args, _ in store_entry.call_args_list if args[3]]
+    assert len(thread_args) == 1
+    assert len(thread_args[0][2].comments) == 1  # 1 root
+
+    deferred = enqueue_entries.call_args[0][0]
+    assert len(deferred) == 10  # 9 failed threads + the next page
+    assert ('https://ftm.livejournal.com/7232256.html?thread=88040960'
+            not in deferred)
+
+
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
+@mock.patch('livecorpus.store.store_entry', store_entry)
+@mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
+def test_scrape_entry_threads_inline_bounded(client):
+    enqueue_entries.reset_mock()
+    entry = slurp_test_data(7232256)
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def slow_thread_fetch(url):
+        if 'thread=' not in url:
+            return entry
+        with lock:
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        raise IOError('thread fetch failed')
+
+    fetch_bytes.side_effect = slow_thread_fetch
+
+    client.post('/scrape_entry',
+                data='https://ftm.livejournal.com/7232256.html')
+    fetch_bytes.side_effect = None
+    # All 10 threads were tried, but never more than the cap at once.
+    assert len(enqueue_entries.call_args[0][0]) == 11
+    assert 1 < most_in_flight[0] <= MAX_INLINE_THREAD_FETCHES
+
+
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
+@mock.patch('livecorpus.store.store_entry', store_entry)
+@mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
+def test_scrape_entry_thread_next_page_inline(client):
+    enqueue_entries.reset_mock()
+    store_entry.reset_mock()
+    entry = slurp_test_data(7232256)
+    thread_next_page = ('https://ftm.livejournal.com/7232256.html'
+                        '?thread=88040960&page=2#comments')
+    # Give the thread page a second page of its own.
+    thread = slurp_test_data('7232256-88040960').replace(
+        b'<li class="comments-pages-item comments-pages-prevnext '
+        b'comments-pages-next comments-pages-next-dis"><span '
+        b'class="comments-pages-button comments-pages-button-disabled">'
+        b'<span class="arrow arrow--right">&rarr;</span></span></li>',
+        b'<li class="comments-pages-item comments-pages-prevnext '
+        b'comments-pages-next"><a class="comments-pages-button" '
+        b'href="https://ftm.livejournal.com/7232256.html'
+        b'?thread=88040960&amp;page=2#comments">'
+        b'<span class="arrow arrow--right">&rarr;</span></a></li>')
+
+    def fetch_one_thread(url):
+        if url.endswith('?thread=88040960'):
+            return thread
+        if 'thread=' in url:
+            raise IOError('thread fetch failed')
+        return entry
+
+    fetch_bytes.side_effect = fetch_one_thread
+
+    client.post('/scrape_entry',
+                data='https://ftm.livejournal.com/7232256.html')
+    fetch_bytes.side_effect = None
+    assert store_entry.call_count == 2
+
+    deferred = enqueue_entries.call_args[0][0]
+    # 9 failed threads, the thread's next page, and the entry's next page
+    assert len(deferred) == 11
+    assert thread_next_page in deferred
 
 
-@mock.patch('livecorpus.fetch.fetch_text', fetch_text)
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
 @mock.patch('livecorpus.store.store_entry', store_entry)
 @mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
 def test_scrape_entry_thread(client):
     enqueue_entries.reset_mock()
 
-    fetch_text.return_value = slurp_test_data('7232256-88040960')
+    fetch_bytes.return_value = slurp_test_data('7232256-88040960')
 
     client.post('/scrape_entry',
                 data='https://ftm.livejournal.com/7232256.html?thread=88040960')
@@ -108,13 +227,13 @@ def test_scrape_entry_thread(client):
     assert enqueue_entries.call_args[1] == {}
 
 
-@mock.patch('livecorpus.fetch.fetch_text', fetch_text)
+@mock.patch('livecorpus.fetch.fetch_bytes', fetch_bytes)
 @mock.patch('livecorpus.store.store_entry', store_entry)
 @mock.patch('livecorpus.task_queue.enqueue_entries', enqueue_entries)
 def test_scrape_entry_second_page_comments(client):
     enqueue_entries.reset_mock()
 
-    fetch_text.return_value = slurp_test_data('7232256-2')
+    fetch_bytes.return_value = slurp_test_data('7232256-2')
 
     client.post('/scrape_entry',
                 data='https://ftm.livejournal.com/7232256.html?page=2#comments')
@@ -0,0 +1,30 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+from .context import livecorpus
+from livecorpus import fetch
+
+
+@mock.patch.object(fetch.session, 'get')
+def test_fetch_bytes(get):
+    get.return_value.content = b'fetched_bytes'
+
+    url = 'https://ftm.livejournal.com/7232256.html'
+    assert fetch.fetch_bytes(url) == b'fetched_bytes'
+    # A stalled page mustn't hold the handler forever.
+    get.assert_called_once_with(url,
+                                cookies={'adult_explicit': '1'},
+                                timeout=fetch.TIMEOUT)
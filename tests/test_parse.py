@@ -14,11 +14,11 @@
 
 import datetime
 from dateutil.tz import tzoffset
-from functools import reduce
 import pytest
+from typing import List
 
 from .context import livecorpus, slurp_test_data
-from livecorpus import fetch, model, parse
+from livecorpus import fetch, model, parse, quirks
 from livecorpus.model import LiveJournalComment, LiveJournalEntry
 
 
@@ -123,6 +123,52 @@ def test_7232256_88040960():
     assert not entry.next_page
 
 
+def test_7232256_2_orphaned_reply():
+    # A deleted reply with nothing before it to hang off of.
+    page = slurp_test_data('7232256-2').replace(
+        b'<div id="ljcmt88047360" class="comment-wrap edited" '
+        b'style="margin-left:0px;">',
+        b'<div id="ljcmt88047360" class="comment-wrap deleted" '
+        b'style="margin-left:25px;">')
+
+    with pytest.raises(quirks.SnowflakeError,
+                       match='no previous siblings found'):
+        parse.parse_entry(page, None)
+
+
+def test_7232256_2_reply_without_style():
+    # A reply's Parent link places it; it doesn't need an indent.
+    page = slurp_test_data('7232256-2').replace(
+        b'<div id="ljcmt88054528" class="comment-wrap" '
+        b'style="margin-left:25px;">', b'<div id="ljcmt88054528" '
+        b'class="comment-wrap">')
+
+    entry = parse.parse_entry(page, None).entry
+    assert entry.comments[0].children[0].id == '88054528'
+
+
+def test_7232256_2_deleted_reply_without_style():
+    page = slurp_test_data('7232256-2').replace(
+        b'<div id="ljcmt88047872" class="comment-wrap" '
+        b'style="margin-left:0px;">', b'<div id="ljcmt88047872" '
+        b'class="comment-wrap deleted">')
+
+    with pytest.raises(quirks.SnowflakeError, match='Could not find parent'):
+        parse.parse_entry(page, None)
+
+
+def test_7232256_2_skipped_indent():
+    # A deleted reply two levels deeper than the comment before it.
+    page = slurp_test_data('7232256-2').replace(
+        b'<div id="ljcmt88047872" class="comment-wrap" '
+        b'style="margin-left:0px;">',
+        b'<div id="ljcmt88047872" class="comment-wrap deleted" '
+        b'style="margin-left:75px;">')
+
+    with pytest.raises(quirks.SnowflakeError, match='Could not find parent'):
+        parse.parse_entry(page, None)
+
+
 def test_585122():
     entry = _slurp_and_parse_entry('585122').entry
 
@@ -168,11 +214,20 @@ def _slurp_and_parse_entry(id: str) -> parse.EntryParseResult:
 
 
 def _total_comments(entry: LiveJournalEntry) -> int:
-    return reduce(lambda total, comment: total + _total_children(comment),
-                  entry.comments, 0)
+    return _count_trees(entry.comments)
 
 
 def _total_children(comment: LiveJournalComment) -> int:
     # Includes self!
-    return reduce(lambda total, child: total + _total_children(child),
-                  comment.children, 1)
+    return _count_trees([comment])
+
+
+def _count_trees(roots: List[LiveJournalComment]) -> int:
+    # Walk every root with one shared stack so deep threads can't hit the
+    # recursion limit.
+    total = 0
+    stack = list(roots)
+    while stack:
+        total += 1
+        stack.extend(stack.pop().children)
+    return total
@@ -0,0 +1,109 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+from google.api_core.exceptions import ServiceUnavailable
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
+from google.cloud.firestore_v1.types import BatchWriteResponse, WriteResult
+from google.rpc import code_pb2, status_pb2
+import pytest
+from unittest import mock
+
+from .context import livecorpus
+from livecorpus import store
+from livecorpus.model import LiveJournalComment, LiveJournalEntry
+
+# A real client, so BulkWriter runs for real; only the RPCs are mocked.
+db = firestore.Client(project='trans-corpus',
+                      credentials=AnonymousCredentials())
+
+
+def _entry() -> LiveJournalEntry:
+    published = datetime.datetime(2021, 8, 1, 12, 0)
+    root = LiveJournalComment.live('1', published, 'bixligat', 'first!')
+    reply = LiveJournalComment.dead('2')
+    root.add_child(reply)
+    reply.set_parent(root)
+    return LiveJournalEntry(published, 'bixligat', 'subject', 'content',
+                            [root, LiveJournalComment.dead('3')], [])
+
+
+def _respond(code: int):
+
+    def send(self: BulkWriter, batch) -> BatchWriteResponse:
+        return BatchWriteResponse(
+            write_results=[WriteResult() for _ in range(len(batch))],
+            status=[status_pb2.Status(code=code) for _ in range(len(batch))])
+
+    return send
+
+
+@mock.patch('livecorpus.store._db', lambda: db)
+@mock.patch.object(BulkWriter, '_send', _respond(code_pb2.OK))
+def test_store_entry():
+    store.store_entry('ftm', '7232256', _entry(), False)
+
+
+@mock.patch('livecorpus.store._db', lambda: db)
+@mock.patch.object(BulkWriter, '_send',
+                   mock.Mock(side_effect=ServiceUnavailable('down')))
+def test_store_entry_commit_raises():
+    with pytest.raises(store.StoreError, match='4 of 4 writes failed'):
+        store.store_entry('ftm', '7232256', _entry(), False)
+
+
+@mock.patch('livecorpus.store._db', lambda: db)
+@mock.patch('livecorpus.store.MAX_WRITE_RETRIES', 0)
+@mock.patch.object(BulkWriter, '_send', _respond(code_pb2.UNAVAILABLE))
+def test_store_entry_write_fails():
+    with pytest.raises(store.StoreError, match='4 of 4 writes failed'):
+        store.store_entry('ftm', '7232256', _entry(), False)
+
+
+get_all = mock.MagicMock(name='get_all')
+
+
+@mock.patch('livecorpus.store._db', lambda: db)
+@mock.patch.object(db, 'get_all', get_all)
+@mock.patch.object(BulkWriter, '_send', _respond(code_pb2.OK))
+@mock.patch.object(BulkWriter, 'set', autospec=True, side_effect=BulkWriter.set)
+def test_store_entry_comments_only(bulk_set):
+    comments = db.collection('ftm').document('7232256').collection('Comments')
+    # Root 1 was stored under a zipped parent from an earlier page; root 3
+    # is new.
+    earlier_parent = comments.document('0')
+    get_all.return_value = [
+        mock.Mock(id='1', exists=True, get=lambda _: earlier_parent),
+        mock.Mock(id='3', exists=False),
+    ]
+
+    store.store_entry('ftm', '7232256', _entry(), True)
+    # One round trip for all the roots, and only for their parents.
+    get_all.assert_called_once()
+    args, kwargs = get_all.call_args
+    assert [docref.id for docref in args[0]] == ['1', '3']
+    assert kwargs == {'field_paths': ['parent']}
+
+    # No entry doc; each comment is written once.
+    assert bulk_set.call_count == 3
+    docs = {
+        docref.id: doc
+        for _, docref, doc in (call.args for call in bulk_set.call_args_list)
+    }
+    assert docs.keys() == {'1', '2', '3'}
+    assert docs['1']['parent'] == earlier_parent
+    assert docs['2']['parent'] == comments.document('1')
+    assert docs['3']['parent'] is None
@@ -0,0 +1,77 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from google.api_core.exceptions import Conflict, ServiceUnavailable
+import pytest
+from unittest import mock
+
+from .context import livecorpus
+from livecorpus import task_queue
+
+tq = mock.MagicMock(name='tq')
+
+LINKS = [
+    'https://ftm.livejournal.com/7232256.html?thread=%s' % thread
+    for thread in ('88040448', '88040960', '88041984')
+]
+
+
+def _created_urls():
+    return sorted(task['app_engine_http_request']['body'].decode('utf-8')
+                  for (_, task), _ in tq.create_task.call_args_list)
+
+
+@mock.patch('livecorpus.task_queue._tq', lambda: tq)
+def test_enqueue_entries():
+    tq.reset_mock()
+    tq.create_task.side_effect = None
+
+    task_queue.enqueue_entries(LINKS)
+    assert _created_urls() == sorted(LINKS)
+    for (queue, task), _ in tq.create_task.call_args_list:
+        assert queue.endswith('/queues/livejournal-entries')
+        assert task['app_engine_http_request']['relative_uri'] == (
+            '/scrape_entry')
+
+
+@mock.patch('livecorpus.task_queue._tq', lambda: tq)
+def test_enqueue_entries_empty():
+    tq.reset_mock()
+
+    task_queue.enqueue_entries([])
+    tq.create_task.assert_not_called()
+
+
+@mock.patch('livecorpus.task_queue._tq', lambda: tq)
+def test_enqueue_entries_conflict():
+    tq.reset_mock()
+
+    def dedupe_second(queue, task):
+        if task['app_engine_http_request']['body'] == LINKS[1].encode('utf-8'):
+            raise Conflict('already enqueued')
+
+    tq.create_task.side_effect = dedupe_second
+
+    # A dupe is expected, and mustn't stop the rest of the batch.
+    task_queue.enqueue_entries(LINKS)
+    assert _created_urls() == sorted(LINKS)
+
+
+@mock.patch('livecorpus.task_queue._tq', lambda: tq)
+def test_enqueue_entries_error():
+    tq.reset_mock()
+    tq.create_task.side_effect = ServiceUnavailable('down')
+
+    with pytest.raises(ServiceUnavailable):
+        task_queue.enqueue_entries(LINKS)